@@ -1,3 +1,8 @@
+import copy
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from typing import Dict, List, Literal, Optional, Tuple, Union
 
 import mlx.core as mx
@@ -20,6 +25,8 @@ class EmbeddingModel:
     def __init__(self, model_name: str, max_length: int, mode: Optional[Literal["last", "avg"]] = None):
         self.model = create_model(model_name=model_name, weights=True, strict=True)
         self.tokenizer = create_tokenizer(model_name)
+        if self.tokenizer.pad_token_id is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
         self.max_length = max_length
         self.model.eval()
         self.is_bert = "Bert" == self.model.__class__.__name__
@@ -35,13 +42,11 @@ class EmbeddingModel:
         Returns:
             mx.array: last token pooled embeddings
         """
-        left_padding = attn_mask[:, -1].sum() == attn_mask.shape[0]
-        if left_padding:
-            return embeds[:, -1]
-        else:
-            sequence_lengths = attn_mask.sum(axis=1) - 1
-            batch_size = embeds.shape[0]
-            return embeds[mx.arange(batch_size), sequence_lengths]
+        batch_size, seq_len = attn_mask.shape
+        # with left padding the last token is always in the last column; resolved on device with no host sync
+        left_padding = attn_mask[:, -1].sum() == batch_size
+        sequence_lengths = mx.where(left_padding, seq_len - 1, attn_mask.sum(axis=1) - 1)
+        return embeds[mx.arange(batch_size), sequence_lengths]
 
     def average_pool(self, embeds: mx.array, attn_mask: mx.array) -> mx.array:
         """Average pool embeddings
@@ -56,8 +61,8 @@ class EmbeddingModel:
         embeds = mx.multiply(embeds, attn_mask[..., None])
         return embeds.sum(axis=1) / attn_mask.sum(axis=1)[..., None]
 
-    def normalize(self, embeds: mx.array):
-        """Normalize embeddings
+    def normalize(self, embeds: mx.array) -> mx.array:
+        """L2-normalize embeddings (square, sum, rsqrt and multiply fuse into a single graph)
 
         Args:
             embeds (mx.array): embeddings
@@ -65,32 +70,79 @@ class EmbeddingModel:
         Returns:
             mx.array: normalized embeddings
         """
-        embeds = embeds / mx.linalg.norm(embeds, ord=2, axis=1)[..., None]
-        return mx.array(embeds)
+        return embeds * mx.rsqrt((embeds * embeds).sum(axis=-1, keepdims=True) + 1e-12)
 
-    def prepare_tokens(self, text: List) -> Dict[str, mx.array]:
-        """Prepare tokens for the model
+    def _tokenize(self, text: List, tokenizer: AutoTokenizer) -> Dict[str, np.ndarray]:
+        """Tokenize and pad text with the given tokenizer
 
         Args:
             text (List): input text
+            tokenizer (AutoTokenizer): tokenizer
 
         Returns:
-            Dict[str, mx.array]: tokens for the model
+            Dict[str, np.ndarray]: padded numpy tokens
         """
-        tokens = self.tokenizer(
+        tokens = tokenizer(
             text, max_length=self.max_length - 1, return_attention_mask=False, padding=False, truncation=True
         )
 
+        tokens = tokenizer.pad(tokens, padding=True, return_attention_mask=True, return_tensors="np")
+
         if not self.is_bert:  # otherwise it puts None at the end with eos_token_id
-            tokens["input_ids"] = [input_ids + [self.tokenizer.eos_token_id] for input_ids in tokens["input_ids"]]
+            # append eos after padding: one extra column, filled for every row with a single vectorized write
+            for key, value in tokens.items():
+                pad_value = tokenizer.pad_token_id if key == "input_ids" else 0
+                tokens[key] = np.pad(value, ((0, 0), (0, 1)), constant_values=pad_value)
+            attn_mask = tokens["attention_mask"]
+            if tokenizer.padding_side == "left":
+                eos_positions = np.full(len(attn_mask), attn_mask.shape[1] - 1)
+            else:
+                eos_positions = attn_mask.sum(axis=1)
+            rows = np.arange(len(attn_mask))
+            tokens["input_ids"][rows, eos_positions] = tokenizer.eos_token_id
+            attn_mask[rows, eos_positions] = 1
 
-        if self.tokenizer.pad_token_id is None:
-            self.tokenizer.pad_token = self.tokenizer.eos_token
+        return tokens
 
-        tokens = self.tokenizer.pad(tokens, padding=True, return_attention_mask=True, return_tensors="np")
+    def _to_mlx(self, tokens: Dict[str, np.ndarray]) -> Dict[str, mx.array]:
+        """Convert numpy tokens to mlx arrays
 
-        tokens = {key: mx.array(v.astype(np.int32)) for key, v in tokens.items()}
-        return tokens
+        Args:
+            tokens (Dict[str, np.ndarray]): numpy tokens
+
+        Returns:
+            Dict[str, mx.array]: tokens for the model
+        """
+        # numpy buffers are handed to mlx directly, no python list round-trip. int32 halves the int64 ids
+        # bandwidth; the mask stays int32 too since it is summed into lengths (int8 would overflow > 127 tokens)
+        return {key: mx.array(v.astype(np.int32, copy=False)) for key, v in tokens.items()}
+
+    def prepare_tokens(self, text: List) -> Dict[str, mx.array]:
+        """Prepare tokens for the model
+
+        Args:
+            text (List): input text
+
+        Returns:
+            Dict[str, mx.array]: tokens for the model
+        """
+        return self._to_mlx(self._tokenize(text, self.tokenizer))
+
+    def _embed(self, tokens: Dict[str, mx.array]) -> mx.array:
+        """Run the model, pool and normalize
+
+        Args:
+            tokens (Dict[str, mx.array]): tokens for the model
+
+        Returns:
+            mx.array: normalized embeddings
+        """
+        output, embeds = self.model(**tokens)
+        if self.mode == "last":
+            embeds = self.last_token_pool(output, tokens["attention_mask"])
+        if self.mode == "avg":
+            embeds = self.average_pool(output, tokens["attention_mask"])
+        return self.normalize(embeds)
 
     def __call__(self, text: Union[List[str], str]) -> mx.array:
         """Compute embedding for the input tokens.
@@ -105,11 +157,44 @@ class EmbeddingModel:
         if isinstance(text, str):
             text = [text]
 
-        tokens = self.prepare_tokens(text)
-        output, embeds = self.model(**tokens)
-        if self.mode == "last":
-            embeds = self.last_token_pool(output, tokens["attention_mask"])
-        if self.mode == "avg":
-            embeds = self.average_pool(output, tokens["attention_mask"])
-        embeds = self.normalize(embeds)
-        return embeds
+        return self._embed(self.prepare_tokens(text))
+
+    def encode_many(self, texts: List[str], batch_size: int = 32, num_workers: int = 4) -> mx.array:
+        """Compute embeddings for many texts, tokenizing upcoming batches on worker threads while MLX
+        embeds the current one.
+
+        Args:
+            texts (List[str]): input texts
+            batch_size (int, optional): texts per batch. Defaults to 32.
+            num_workers (int, optional): tokenizer threads (also the number of batches tokenized ahead).
+                Defaults to 4.
+
+        Returns:
+            mx.array: (len(texts), D) normalized embeddings
+        """
+        assert len(texts) > 0, "No texts to encode"
+        assert batch_size > 0, "Batch size must be >0"
+        assert num_workers > 0, "Number of workers must be >0"
+
+        # fast tokenizers are not safe to share across threads, each worker gets its own copy
+        local = threading.local()
+
+        def tokenize(batch: List[str]) -> Dict[str, np.ndarray]:
+            if not hasattr(local, "tokenizer"):
+                local.tokenizer = copy.deepcopy(self.tokenizer)
+            return self._tokenize(batch, local.tokenizer)
+
+        batches = (texts[i : i + batch_size] for i in range(0, len(texts), batch_size))
+        embeds = []
+        with ThreadPoolExecutor(max_workers=num_workers) as pool:
+            pending = deque(pool.submit(tokenize, batch) for batch in islice(batches, num_workers))
+            while pending:
+                tokens = pending.popleft().result()
+                batch = next(batches, None)
+                if batch is not None:
+                    pending.append(pool.submit(tokenize, batch))
+                batch_embeds = self._embed(self._to_mlx(tokens))
+                mx.eval(batch_embeds)
+                embeds.append(batch_embeds)
+
+        return mx.concatenate(embeds, axis=0)
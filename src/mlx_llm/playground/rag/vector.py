@@ -1,22 +1,251 @@
+import json
 import os
 import pickle
 import uuid
-from typing import Dict, Tuple, Union
+from typing import Dict, Literal, Optional, Set, Tuple, Union
 
 import mlx.core as mx
 import numpy as np
 import pandas as pd
-from sklearn.metrics.pairwise import cosine_similarity
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import simsimd
+except ImportError:  # pragma: no cover
+    simsimd = None
+
+try:
+    import hnswlib
+except ImportError:  # pragma: no cover
+    hnswlib = None
+
+try:
+    import faiss
+except ImportError:  # pragma: no cover
+    faiss = None
+
+try:
+    import numba
+except ImportError:  # pragma: no cover
+    numba = None
 
 mx.set_default_device(mx.gpu)
 
+# embeddings are L2-normalized, so every component is in [-1, 1] and one global scale is enough
+INT8_SCALE = 127.0
+# below this many rows a brute-force scan is faster than walking the HNSW graph
+HNSW_MIN_ROWS = 1024
+# bytes of db rows scanned per tile by the NumPy fallback, small enough to stay in L2 (Apple Silicon has MBs of it)
+TILE_BYTES = 1024 * 1024
+
+
+def _json_default(obj):
+    """Serialize NumPy scalars and arrays in metadata for the stdlib json fallback, like orjson's OPT_SERIALIZE_NUMPY"""
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+if numba is not None:
+
+    @numba.njit(fastmath=True, cache=True)
+    def _sift_down(scores, indices, size):  # pragma: no cover
+        """Restore the min-heap property from the root of (scores, indices)"""
+        pos = 0
+        while True:
+            child = 2 * pos + 1
+            if child >= size:
+                break
+            if child + 1 < size and scores[child + 1] < scores[child]:
+                child += 1
+            if scores[pos] <= scores[child]:
+                break
+            scores[pos], scores[child] = scores[child], scores[pos]
+            indices[pos], indices[child] = indices[child], indices[pos]
+            pos = child
+
+    @numba.njit(fastmath=True, cache=True, parallel=True)
+    def _top_k_cosine(queries, matrix, norms, k, n_chunks):  # pragma: no cover
+        """Top k cosine similarities of each (normalized) query against the matrix rows.
+
+        Rows are split into n_chunks chunks (one per thread) and each chunk keeps a k-sized min-heap per
+        query, so the result holds n_chunks * k candidates per query that still have to be merged.
+        """
+        n_queries, dim = queries.shape
+        n = matrix.shape[0]
+        chunk = (n + n_chunks - 1) // n_chunks
+        cand_indices = np.full((n_queries, n_chunks * k), -1, dtype=np.int64)
+        # fastmath assumes no infinities, so empty slots hold -2.0, which is below any cosine similarity
+        cand_scores = np.full((n_queries, n_chunks * k), -2.0, dtype=np.float32)
+        for c in numba.prange(n_chunks):
+            for i in range(c * chunk, min((c + 1) * chunk, n)):
+                for q in range(n_queries):
+                    dot = np.float32(0.0)
+                    for d in range(dim):
+                        dot += queries[q, d] * matrix[i, d]
+                    dot /= norms[i] + 1e-12
+                    scores = cand_scores[q, c * k : (c + 1) * k]
+                    if dot > scores[0]:
+                        indices = cand_indices[q, c * k : (c + 1) * k]
+                        scores[0] = dot
+                        indices[0] = i
+                        _sift_down(scores, indices, k)
+        return cand_indices, cand_scores
 
-class VectorDB:
-    """Easy vector DB implementation"""
 
-    def __init__(self):
-        self.embeddings = []
+class VectorDB:
+    """Easy vector DB implementation
+
+    Args:
+        quantize (Optional[Literal['int8']]): store embeddings quantized as int8 (embeddings are expected to be
+            L2-normalized). Defaults to None.
+        dtype (np.dtype): float storage dtype (np.float32 or np.float16), ignored when quantized.
+            Defaults to np.float32.
+        index (Literal['flat', 'hnsw', 'ivfpq']): 'flat' for brute-force search, 'hnsw' for an approximate HNSW
+            index (requires hnswlib), 'ivfpq' for a compressed IVF-PQ index (requires faiss). Defaults to 'flat'.
+            With the raw embeddings kept, 'ivfpq' only speeds up search, the PQ codes come on top of them.
+        M (Optional[int]): HNSW graph degree (defaults to 16) or number of PQ sub-quantizers for 'ivfpq'
+            (defaults to 64). Defaults to None.
+        ef (int): HNSW construction/search ef. Defaults to 200.
+        nlist (int): number of IVF coarse centroids. Defaults to 1024.
+        nbits (int): bits per PQ code. Defaults to 8.
+        nprobe (int): number of IVF lists scanned per query. Defaults to 8.
+        device (Literal['cpu', 'gpu']): where brute-force queries run. 'gpu' keeps an MLX copy of the embeddings
+            in unified memory and scans it with Metal. Defaults to 'cpu'.
+        keep_embeddings (bool): keep the raw embeddings once the 'ivfpq' index is trained. With False only the
+            PQ codes are kept (M * nbits / 8 bytes per row plus its id) and returned embeddings are decoded from them, so
+            they are approximate. Defaults to True.
+    """
+
+    def __init__(
+        self,
+        quantize: Optional[Literal["int8"]] = None,
+        dtype: np.dtype = np.float32,
+        index: Literal["flat", "hnsw", "ivfpq"] = "flat",
+        M: Optional[int] = None,
+        ef: int = 200,
+        nlist: int = 1024,
+        nbits: int = 8,
+        nprobe: int = 8,
+        device: Literal["cpu", "gpu"] = "cpu",
+        keep_embeddings: bool = True,
+    ):
+        if quantize not in (None, "int8"):
+            raise ValueError(f"Unknown quantization: {quantize}")
+        if np.dtype(dtype) not in (np.float32, np.float16):
+            raise ValueError(f"Unsupported dtype: {dtype}")
+        if device not in ("cpu", "gpu"):
+            raise ValueError(f"Unknown device: {device}")
+        if index not in ("flat", "hnsw", "ivfpq"):
+            raise ValueError(f"Unknown index: {index}")
+        if index == "hnsw" and hnswlib is None:
+            raise ImportError("hnswlib is required for index='hnsw'")
+        if index == "ivfpq" and faiss is None:
+            raise ImportError("faiss is required for index='ivfpq'")
+        if not keep_embeddings and index != "ivfpq":
+            raise ValueError("keep_embeddings=False is only supported for index='ivfpq'")
+        self.quantize = quantize
+        self.index = index
+        self.M = M if M is not None else (64 if index == "ivfpq" else 16)
+        self.ef = ef
+        self.nlist = nlist
+        self.nbits = nbits
+        self.nprobe = nprobe
+        self.device = device
+        self.keep_embeddings = keep_embeddings
+        self._mx_matrix = None
+        self._mx_norms = None
+        self._mx_n = 0
+        self._mx_dirty: Set[int] = set()
+        self._hnsw = None
+        self._ivfpq = None
+        self._dtype = np.dtype(np.int8) if quantize == "int8" else np.dtype(dtype)
         self.metadata = []
+        self._id_to_idx: Dict[str, int] = {}
+        self._emb_matrix = None
+        self._row_norms = None
+        self._n = 0
+        self._cap = 0
+
+    @property
+    def _matrix(self) -> np.ndarray:
+        """(N, D) view over the stored (possibly quantized) embeddings"""
+        if self._emb_matrix is None:
+            return np.empty((0, 0), dtype=self._dtype)
+        return self._emb_matrix[: self._n]
+
+    @property
+    def _codes_only(self) -> bool:
+        """Whether the raw embeddings were released and the rows only live as PQ codes in the IVF-PQ index"""
+        return self._ivfpq is not None and not self.keep_embeddings
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        """(N, D) float32 embeddings (dequantized if the db is quantized, decoded if only PQ codes are kept)"""
+        if self._codes_only:
+            return self._ivfpq.reconstruct_n(0, self._n)
+        return self._from_storage(self._matrix)
+
+    def _rows(self, indices: np.ndarray) -> np.ndarray:
+        """Float32 embeddings of the given rows
+
+        Args:
+            indices (np.ndarray): row indices
+
+        Returns:
+            np.ndarray: (len(indices), D) float32 embeddings
+        """
+        if self._codes_only:
+            return self._ivfpq.reconstruct_batch(np.asarray(indices, dtype=np.int64))
+        return self._from_storage(self._matrix[indices])
+
+    def _to_storage(self, embeddings: np.ndarray) -> np.ndarray:
+        """Cast float embeddings to the storage dtype
+
+        Args:
+            embeddings (np.ndarray): float embeddings
+
+        Returns:
+            np.ndarray: embeddings in storage dtype
+        """
+        if self.quantize == "int8":
+            return np.clip(np.rint(embeddings * INT8_SCALE), -127, 127).astype(np.int8)
+        return embeddings.astype(self._dtype, copy=False)
+
+    def _from_storage(self, embeddings: np.ndarray) -> np.ndarray:
+        """Cast stored embeddings back to float32
+
+        Args:
+            embeddings (np.ndarray): embeddings in storage dtype
+
+        Returns:
+            np.ndarray: float32 embeddings
+        """
+        if embeddings.dtype == np.int8:
+            return embeddings.astype(np.float32) / INT8_SCALE
+        return embeddings.astype(np.float32, copy=False)
+
+    def _grow(self, dim: int):
+        """Grow the embeddings matrix geometrically
+
+        Args:
+            dim (int): embedding dimension
+        """
+        cap = max(16, 2 * self._cap)
+        matrix = np.empty((cap, dim), dtype=self._dtype)
+        row_norms = np.empty(cap, dtype=np.float32)
+        if self._emb_matrix is not None:
+            matrix[: self._n] = self._emb_matrix[: self._n]
+            row_norms[: self._n] = self._row_norms[: self._n]
+        self._emb_matrix = matrix
+        self._row_norms = row_norms
+        self._cap = cap
 
     def add(self, embedding: np.array, text: str, source: str, page: str):
         """Add entry
@@ -27,50 +256,242 @@ class VectorDB:
             source (str): source document
             page (str): source document page
         """
-        # if isinstance(embedding, mx.array):
-        #     embedding = np.array(embedding)
+        embedding = np.asarray(embedding, dtype=np.float32)
         _id = str(uuid.uuid4())
-        self.embeddings.append(embedding)
+        if not self._codes_only:
+            if self._n == self._cap:
+                self._grow(embedding.shape[-1])
+            self._emb_matrix[self._n] = self._to_storage(embedding)
+            row = self._emb_matrix[self._n].astype(np.float32)
+            self._row_norms[self._n] = np.sqrt(np.vdot(row, row))
+        if self._hnsw is not None:
+            if self._cap > self._hnsw.get_max_elements():
+                self._hnsw.resize_index(self._cap)
+            # row indices are used as hnsw labels, a previously deleted label is simply revived
+            self._hnsw.add_items(embedding.reshape(1, -1), [self._n])
+        if self._ivfpq is not None:
+            self._ivfpq.add_with_ids(embedding.reshape(1, -1), np.array([self._n], dtype=np.int64))
+        self._n += 1
         self.metadata.append({"id": _id, "text": text, "source": source, "page": page})
+        self._id_to_idx[_id] = self._n - 1
 
-    @property
-    def _uuid_to_index(self):
-        return {entry["id"]: i for i, entry in enumerate(self.metadata)}
+    def _similarity(self, embeddings: np.ndarray, start: int = 0, stop: Optional[int] = None) -> np.ndarray:
+        """Cosine similarity between normalized queries and the stored embeddings in rows [start, stop).
 
-    @property
-    def _index_to_uuid(self):
-        return {i: entry["id"] for i, entry in enumerate(self.metadata)}
+        If simsimd is installed, similarities come from its SIMD cosine kernels (native int8/float16
+        kernels for quantized/half precision dbs). Otherwise dot products are divided by the cached
+        row norms, so no norm is recomputed per query.
 
-    def query(self, embedding: mx.array, top_k=5):
-        """Query db based on a single embedding
+        Args:
+            embeddings (np.ndarray): (Q, D) L2-normalized float32 queries
+            start (int, optional): first row. Defaults to 0.
+            stop (Optional[int], optional): last row (excluded). Defaults to None (all rows).
+
+        Returns:
+            np.ndarray: (Q, stop - start) similarities
+        """
+        stop = self._n if stop is None else min(stop, self._n)
+        matrix = self._emb_matrix[start:stop]
+        if simsimd is not None:
+            queries = self._to_storage(embeddings)
+            distances = simsimd.cdist(queries, matrix, metric="cosine")
+            return 1 - np.asarray(distances, dtype=np.float32)
+        # float16 rows are upcast one tile at a time, never the whole db
+        dots = embeddings @ matrix.astype(np.float32, copy=False).T
+        # row norms are in storage units, which also removes the int8 scale
+        return dots / (self._row_norms[start:stop] + 1e-12)
+
+    def _scan(self, embeddings: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Brute-force scan of the db in cache-sized row tiles, keeping a running top k per query
 
         Args:
-            embedding (np.array): embedding
+            embeddings (np.ndarray): (Q, D) L2-normalized float32 queries
+            top_k (int): number of results (<= number of rows)
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (Q, C) candidate row indices and similarities (C >= top_k, unsorted)
+        """
+        if simsimd is not None:
+            tile = self._n  # simsimd streams the whole matrix in one call
+        else:
+            tile = max(top_k, TILE_BYTES // (self._emb_matrix.shape[1] * self._dtype.itemsize))
+        top_indices = np.empty((len(embeddings), 0), dtype=np.int64)
+        top_scores = np.empty((len(embeddings), 0), dtype=np.float32)
+        for start in range(0, self._n, tile):
+            similarity = self._similarity(embeddings, start, start + tile)
+            k = min(top_k, similarity.shape[1])
+            local = np.argpartition(similarity, -k, axis=1)[:, -k:]
+            top_indices = np.concatenate([top_indices, local + start], axis=1)
+            top_scores = np.concatenate([top_scores, np.take_along_axis(similarity, local, axis=1)], axis=1)
+            if top_indices.shape[1] > top_k:
+                keep = np.argpartition(top_scores, -top_k, axis=1)[:, -top_k:]
+                top_indices = np.take_along_axis(top_indices, keep, axis=1)
+                top_scores = np.take_along_axis(top_scores, keep, axis=1)
+        return top_indices, top_scores
+
+    def _sync_mlx(self):
+        """Update the MLX copy of the embeddings in place: rows swapped in by deletes are patched and rows
+        added since the last sync are appended. The copy is only reallocated when the db outgrows it.
+        """
+        # int8 rows are scanned as float16, the row norms (storage units) take care of the scale
+        dtype = mx.float32 if self._dtype == np.float32 else mx.float16
+        if self._mx_matrix is None:
+            self._mx_n = 0
+            self._mx_dirty.clear()
+        if self._mx_matrix is None or self._mx_matrix.shape[0] < self._n:
+            matrix = mx.zeros((self._cap, self._emb_matrix.shape[1]), dtype=dtype)
+            norms = mx.zeros((self._cap,), dtype=mx.float32)
+            if self._mx_n:
+                matrix[: self._mx_n] = self._mx_matrix[: self._mx_n]
+                norms[: self._mx_n] = self._mx_norms[: self._mx_n]
+            self._mx_matrix = matrix
+            self._mx_norms = norms
+        dirty = np.array(sorted(i for i in self._mx_dirty if i < self._mx_n), dtype=np.int64)
+        if len(dirty):
+            self._mx_matrix[mx.array(dirty)] = mx.array(self._emb_matrix[dirty]).astype(dtype)
+            self._mx_norms[mx.array(dirty)] = mx.array(self._row_norms[dirty])
+        self._mx_dirty.clear()
+        if self._mx_n < self._n:
+            rows = np.ascontiguousarray(self._emb_matrix[self._mx_n : self._n])
+            self._mx_matrix[self._mx_n : self._n] = mx.array(rows).astype(dtype)
+            self._mx_norms[self._mx_n : self._n] = mx.array(self._row_norms[self._mx_n : self._n])
+            self._mx_n = self._n
+
+    def _scan_mlx(self, embeddings: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Brute-force scan on the GPU with MLX, only the top k indices and scores come back to NumPy
+
+        The MLX copy of the embeddings is synced with the db first, see _sync_mlx.
+
+        Args:
+            embeddings (np.ndarray): (Q, D) L2-normalized float32 queries
+            top_k (int): number of results (<= number of rows)
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (Q, top_k) row indices and similarities (unsorted)
+        """
+        self._sync_mlx()
+        queries = mx.array(embeddings).astype(self._mx_matrix.dtype)
+        similarity = (queries @ self._mx_matrix[: self._n].T).astype(mx.float32) / (self._mx_norms[: self._n] + 1e-12)
+        top_indices = mx.argpartition(-similarity, kth=top_k - 1, axis=-1)[:, :top_k]
+        top_scores = mx.take_along_axis(similarity, top_indices, axis=-1)
+        mx.eval(top_indices, top_scores)
+        return np.array(top_indices).astype(np.int64), np.array(top_scores)
+
+    def _build_hnsw(self):
+        """Build the HNSW index over the current embeddings"""
+        self._hnsw = hnswlib.Index(space="cosine", dim=self._emb_matrix.shape[1])
+        self._hnsw.init_index(max_elements=self._cap, ef_construction=self.ef, M=self.M)
+        self._hnsw.set_ef(self.ef)
+        self._hnsw.add_items(self.embeddings, np.arange(self._n))
+
+    def train(self):
+        """Train the IVF-PQ index on the current embeddings and index them.
+
+        Until the index is trained, queries fall back to a brute-force scan. Training needs at least
+        max(nlist, 2 ** nbits) embeddings (coarse centroids and PQ codebooks), Faiss recommends 39 times that.
+
+        Raises:
+            ValueError: index is not 'ivfpq', embedding size not divisible by M or not enough embeddings
+        """
+        if self.index != "ivfpq":
+            raise ValueError("train is only available for index='ivfpq'")
+        min_rows = max(self.nlist, 2**self.nbits)
+        if self._n < min_rows:
+            raise ValueError(
+                f"IVF-PQ training needs at least max(nlist, 2 ** nbits)={min_rows} embeddings, got {self._n}"
+            )
+        embeddings = np.ascontiguousarray(self.embeddings)
+        dim = embeddings.shape[1]
+        if dim % self.M != 0:
+            raise ValueError(f"embedding size {dim} is not divisible by M={self.M}")
+        quantizer = faiss.IndexFlatIP(dim)
+        index = faiss.IndexIVFPQ(quantizer, dim, self.nlist, self.M, self.nbits, faiss.METRIC_INNER_PRODUCT)
+        index.train(embeddings)
+        if not self.keep_embeddings:
+            # rows are decoded by id, which needs an id -> list lookup that survives remove_ids
+            index.set_direct_map_type(faiss.DirectMap.Hashtable)
+        index.add_with_ids(embeddings, np.arange(self._n, dtype=np.int64))
+        index.nprobe = self.nprobe
+        self._ivfpq = index
+        if not self.keep_embeddings:
+            self._emb_matrix = None
+            self._row_norms = None
+            self._cap = 0
+            self._mx_matrix = None
+
+    def _search(self, embeddings: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Find the top k most similar rows for each query
+
+        Args:
+            embeddings (np.ndarray): (Q, D) L2-normalized float32 queries
+            top_k (int): number of results (<= number of rows)
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (Q, top_k) row indices and similarities, sorted by decreasing
+                similarity. Indices are -1 where the index returned fewer than top_k results.
+        """
+        if self.index == "hnsw" and self._n >= HNSW_MIN_ROWS:
+            if self._hnsw is None:
+                self._build_hnsw()
+            self._hnsw.set_ef(max(self.ef, top_k))
+            labels, distances = self._hnsw.knn_query(embeddings, k=top_k)
+            return labels.astype(np.int64), 1 - distances
+
+        if self._ivfpq is not None:
+            scores, ids = self._ivfpq.search(embeddings, top_k)
+            return ids, scores
+
+        if self.device == "gpu":
+            candidates, similarity = self._scan_mlx(embeddings, top_k)
+        elif simsimd is None and numba is not None and self._dtype != np.float16:
+            # fused dot + top k scan, only the per-thread candidates are left to merge
+            candidates, similarity = _top_k_cosine(
+                embeddings, self._matrix, self._row_norms[: self._n], top_k, min(numba.get_num_threads(), self._n)
+            )
+        else:
+            candidates, similarity = self._scan(embeddings, top_k)
+        keep = np.argpartition(similarity, -top_k, axis=1)[:, -top_k:]
+        top_indices = np.take_along_axis(candidates, keep, axis=1)
+        top_scores = np.take_along_axis(similarity, keep, axis=1)
+        order = np.argsort(top_scores, axis=1)[:, ::-1]
+        return np.take_along_axis(top_indices, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+    def query(self, embedding: mx.array, top_k=5, return_embeddings: bool = False):
+        """Query db based on a single embedding or a batch of embeddings.
+
+        Args:
+            embedding (np.array): (D,) embedding or (Q, D) batch of embeddings
             top_k (int, optional): top k results. Defaults to 5.
+            return_embeddings (bool, optional): also return the matched embeddings. Defaults to False.
 
         Raises:
             ValueError: no embeddings in db
 
         Returns:
-            Dict: output dictionary with metadata, similarity and embedding
+            List[Dict]: output dictionaries with metadata, similarity and (optionally) embedding (one list
+                per query for a batch of embeddings)
         """
-        if len(self.embeddings) == 0:
+        if self._n == 0:
             raise ValueError("No embeddings in db")
 
-        if isinstance(embedding, mx.array):
-            embedding = np.array(embedding)
+        embedding = np.asarray(embedding, dtype=np.float32)
+        single = embedding.ndim == 1
+        embeddings = np.ascontiguousarray(embedding.reshape(-1, embedding.shape[-1]))
+        embeddings = embeddings / (np.sqrt((embeddings * embeddings).sum(axis=1, keepdims=True)) + 1e-12)
 
-        db_embeddings = np.array(self.embeddings)
-        similarity = cosine_similarity([embedding], db_embeddings).flatten()
-        top_indices = np.argsort(similarity)[-top_k:][::-1]
+        top_indices, top_scores = self._search(embeddings, min(top_k, self._n))
 
         output = []
-        for metadata, score, embedding in zip(
-            [self.metadata[i] for i in top_indices], similarity[top_indices], db_embeddings[top_indices]
-        ):
-            output.append({"metadata": metadata, "score": score, "embedding": embedding})
+        for indices, scores in zip(top_indices, top_scores):
+            found = indices >= 0
+            indices, scores = indices[found], scores[found]
+            results = [{"metadata": self.metadata[i], "score": sim_val} for i, sim_val in zip(indices, scores)]
+            if return_embeddings:
+                for result, emb in zip(results, self._rows(indices)):
+                    result["embedding"] = emb
+            output.append(results)
 
-        return output
+        return output[0] if single else output
 
     def delete(self, uuid: str):
         """Delete entry
@@ -78,25 +499,127 @@ class VectorDB:
         Args:
             uuid (str): uuid
         """
-        idx = self._uuid_to_index[uuid]
-        self.embeddings = [embed for i, embed in enumerate(self.embeddings) if i != idx]
-        self.metadata = [entry for i, entry in enumerate(self.metadata) if i != idx]
+        idx = self._id_to_idx.pop(uuid)
+        last = self._n - 1
+        # swap with the last row instead of shifting the whole matrix
+        if idx != last:
+            if not self._codes_only:
+                self._emb_matrix[idx] = self._emb_matrix[last]
+                self._row_norms[idx] = self._row_norms[last]
+            self.metadata[idx] = self.metadata[last]
+            self._id_to_idx[self.metadata[idx]["id"]] = idx
+        if self._hnsw is not None:
+            # labels follow row indices: move the last vector under label idx and retire the last label
+            if idx != last:
+                self._hnsw.add_items(self._from_storage(self._emb_matrix[idx : idx + 1]), [idx])
+            self._hnsw.mark_deleted(last)
+        if self._ivfpq is not None:
+            # the last row is read before its codes are removed (it is decoded from them if only codes are kept)
+            moved = self._rows(np.array([last]))
+            self._ivfpq.remove_ids(np.array([idx, last], dtype=np.int64))
+            if idx != last:
+                self._ivfpq.add_with_ids(moved, np.array([idx], dtype=np.int64))
+        if self._mx_matrix is not None and idx < self._mx_n:
+            # the MLX copy still holds the deleted row, the swapped in row is patched on the next scan
+            self._mx_dirty.add(idx)
+        self.metadata.pop()
+        self._n -= 1
+        self._mx_n = min(self._mx_n, self._n)
 
     def drop(self):
         """Drop db"""
-        self.embeddings = []
         self.metadata = []
+        self._id_to_idx = {}
+        self._emb_matrix = None
+        self._row_norms = None
+        self._n = 0
+        self._cap = 0
+        self._hnsw = None
+        self._ivfpq = None
+        self._mx_matrix = None
 
     def load(self, db_path: str):
-        """Load db
+        """Load db. Embeddings saved as .npy are memory-mapped (copy-on-write), so rows are paged in on demand.
 
         Args:
             db_path (str): db path
         """
-        self.embeddings = np.load(os.path.join(db_path, "embeddings.npz"))["arr_0"]
-        self.embeddings = [mx.array(embed) for embed in self.embeddings]
-        with open(os.path.join(db_path, "metadata.pkl"), "rb") as f:
-            self.metadata = pickle.load(f)
+        npy_path = os.path.join(db_path, "embeddings.npy")
+        npz_path = os.path.join(db_path, "embeddings.npz")
+        # a db saved with keep_embeddings=False has no raw embeddings, its rows only live in ivfpq.index
+        codes_only = not os.path.exists(npy_path) and not os.path.exists(npz_path)
+        if codes_only and self.keep_embeddings:
+            raise ValueError(f"{db_path} has no raw embeddings, load it with index='ivfpq' and keep_embeddings=False")
+        if os.path.exists(npy_path):
+            embeddings = np.load(npy_path, mmap_mode="c")
+        elif not codes_only:  # legacy zipped format
+            embeddings = np.load(npz_path)["arr_0"]
+        else:
+            embeddings = np.empty((0, 0), dtype=self._dtype)
+        # row norms are in storage units, they can only be reused if the storage dtype did not change
+        converted = embeddings.dtype != self._dtype
+        if converted:
+            embeddings = self._to_storage(self._from_storage(embeddings))
+        self._emb_matrix = embeddings
+        self._n = self._cap = len(self._emb_matrix)
+        self._mx_matrix = None
+        norms_path = os.path.join(db_path, "row_norms.npy")
+        if os.path.exists(norms_path) and not converted:
+            self._row_norms = np.load(norms_path)
+        else:
+            rows = self._emb_matrix.astype(np.float32)
+            self._row_norms = np.sqrt(np.einsum("nd,nd->n", rows, rows))
+        if self._n == 0:  # an empty db has no embedding size yet, the matrix is allocated on the first add
+            self._emb_matrix = None
+            self._row_norms = None
+        json_path = os.path.join(db_path, "metadata.json")
+        if os.path.exists(json_path):
+            with open(json_path, "rb") as f:
+                self.metadata = orjson.loads(f.read()) if orjson is not None else json.load(f)
+        else:  # legacy pickled metadata
+            with open(os.path.join(db_path, "metadata.pkl"), "rb") as f:
+                self.metadata = pickle.load(f)
+        self._id_to_idx = {entry["id"]: i for i, entry in enumerate(self.metadata)}
+        if codes_only:
+            self._n = len(self.metadata)
+        self._hnsw = None
+        hnsw_path = os.path.join(db_path, "hnsw.bin")
+        if self.index == "hnsw" and self._n > 0 and os.path.exists(hnsw_path):
+            hnsw = hnswlib.Index(space="cosine", dim=self._emb_matrix.shape[1])
+            hnsw.load_index(hnsw_path)
+            # an index that does not cover exactly the saved rows is stale, it is rebuilt lazily instead
+            if hnsw.element_count == self._n:
+                hnsw.set_ef(self.ef)
+                self._hnsw = hnsw
+        self._ivfpq = None
+        ivfpq_path = os.path.join(db_path, "ivfpq.index")
+        if self.index == "ivfpq" and os.path.exists(ivfpq_path):
+            ivfpq = faiss.read_index(ivfpq_path)
+            # an index that does not cover exactly the saved rows is stale, train() has to be called again
+            if ivfpq.ntotal == self._n:
+                ivfpq.nprobe = self.nprobe
+                self._ivfpq = ivfpq
+        if codes_only and self._ivfpq is None:
+            raise ValueError(f"{ivfpq_path} is missing or does not cover the saved rows")
+        if self._codes_only and self._emb_matrix is not None:
+            # saved with the raw embeddings, only the PQ codes are kept
+            if self._ivfpq.direct_map.type != faiss.DirectMap.Hashtable:
+                self._ivfpq.set_direct_map_type(faiss.DirectMap.Hashtable)
+            self._emb_matrix = None
+            self._row_norms = None
+            self._cap = 0
+
+    @staticmethod
+    def _save_npy(path: str, array: np.ndarray):
+        """Write an uncompressed .npy file through a temporary file, so a memory-mapped db can be saved in place
+
+        Args:
+            path (str): file path
+            array (np.ndarray): array to save
+        """
+        with open(f"{path}.tmp", "wb") as f:
+            np.save(f, array)
+        os.replace(f"{path}.tmp", path)
 
     def save(self, db_path: str):
         """Save db
@@ -105,10 +628,36 @@ class VectorDB:
             db_path (str): db path
         """
         os.makedirs(db_path, exist_ok=True)
-        np.savez(os.path.join(db_path, "embeddings.npz"), np.array(self.embeddings))
+        if self._codes_only:
+            # ivfpq.index holds every row, stale raw embeddings would be loaded instead of it
+            for name in ("embeddings.npy", "embeddings.npz", "row_norms.npy"):
+                if os.path.exists(os.path.join(db_path, name)):
+                    os.remove(os.path.join(db_path, name))
+        else:
+            self._save_npy(os.path.join(db_path, "embeddings.npy"), self._matrix)
+            row_norms = self._row_norms[: self._n] if self._row_norms is not None else np.empty(0, dtype=np.float32)
+            self._save_npy(os.path.join(db_path, "row_norms.npy"), row_norms)
         # save db with no embeddings key
-        with open(os.path.join(db_path, "metadata.pkl"), "wb") as f:
-            pickle.dump(self.metadata, f)
+        with open(os.path.join(db_path, "metadata.json"), "wb") as f:
+            if orjson is not None:
+                f.write(orjson.dumps(self.metadata, option=orjson.OPT_SERIALIZE_NUMPY))
+            else:
+                f.write(json.dumps(self.metadata, default=_json_default).encode("utf-8"))
+        hnsw_path = os.path.join(db_path, "hnsw.bin")
+        if self._n == 0:  # every row was deleted, the index is rebuilt lazily once the db is large enough again
+            self._hnsw = None
+        if self._hnsw is not None:
+            if self._hnsw.element_count != self._n:
+                # retired labels from deletes are compacted away, so the saved index covers exactly the saved rows
+                self._build_hnsw()
+            self._hnsw.save_index(hnsw_path)
+        elif os.path.exists(hnsw_path):
+            os.remove(hnsw_path)
+        ivfpq_path = os.path.join(db_path, "ivfpq.index")
+        if self._ivfpq is not None:
+            faiss.write_index(self._ivfpq, ivfpq_path)
+        elif os.path.exists(ivfpq_path):
+            os.remove(ivfpq_path)
 
     def __getitem__(self, idx: Union[int, str]) -> Tuple[mx.array, Dict]:
         """Get item
@@ -124,8 +673,8 @@ class VectorDB:
         """
         if isinstance(idx, str):
             try:
-                idx = self._uuid_to_index[idx]  # getting integer idx
-                embedding = self.embeddings[idx]
+                idx = self._id_to_idx[idx]  # getting integer idx
+                embedding = mx.array(self._rows(np.array([idx]))[0])
                 metadata = self.metadata[idx]
             except KeyError:
                 raise KeyError(f"uuid {idx} not found")  # noqa: B904
@@ -133,7 +682,7 @@ class VectorDB:
         elif isinstance(idx, int):
             if idx >= len(self.metadata):
                 raise IndexError(f"idx {idx} out of range")
-            embedding = self.embeddings[idx]
+            embedding = mx.array(self._rows(np.array([idx]))[0])
             metadata = self.metadata[idx]
 
         else: